@@ -0,0 +1,108 @@
+"""
+Cache Helper Functions
+
+Optional Redis cache for read-mostly endpoints. When REDIS_URL is not set every
+helper is a no-op and callers fall through to MongoDB. Redis errors are logged
+and treated as a miss, so an outage never fails a request.
+"""
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError, WatchError
+import logging
+import orjson
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+redis = None
+
+redis_url = os.getenv("REDIS_URL")
+
+if redis_url:
+    redis = aioredis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+async def get_cached(key: str):
+    """Return the decoded value stored under key, or None on a miss"""
+    if redis is None:
+        return None
+
+    try:
+        cached = await redis.get(key)
+    except RedisError as e:
+        logger.warning("Cache read for %s failed: %s", key, e)
+        return None
+    return orjson.loads(cached) if cached is not None else None
+
+# Each invalidation bumps a per-key epoch; expires so per-child keys don't accumulate
+EPOCH_TTL = 24 * 3600
+
+def _epoch_key(key: str) -> str:
+    return f"{key}:epoch"
+
+async def get_epoch(key: str):
+    """Current invalidation epoch for key, or None when caching is unavailable.
+    Pass it to set_cached so a value read before an invalidation is not stored after it."""
+    if redis is None:
+        return None
+
+    try:
+        return await redis.get(_epoch_key(key)) or b"0"
+    except RedisError as e:
+        logger.warning("Cache epoch read for %s failed: %s", key, e)
+        return None
+
+async def set_cached(key: str, value, ttl: int, epoch: bytes = None):
+    """Store a JSON-serializable value under key for ttl seconds, skipped if key was invalidated since epoch"""
+    if redis is None:
+        return
+
+    data = orjson.dumps(value)
+    try:
+        if epoch is None:
+            await redis.setex(key, ttl, data)
+            return
+        async with redis.pipeline(transaction=True) as pipe:
+            await pipe.watch(_epoch_key(key))
+            if (await pipe.get(_epoch_key(key)) or b"0") != epoch:
+                return
+            pipe.multi()
+            pipe.setex(key, ttl, data)
+            await pipe.execute()
+    except WatchError:
+        pass
+    except RedisError as e:
+        logger.warning("Cache write for %s failed: %s", key, e)
+
+async def invalidate(*keys: str):
+    """Drop cached keys and bump their epochs"""
+    if redis is None:
+        return
+
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(*keys)
+            for key in keys:
+                pipe.incr(_epoch_key(key))
+                pipe.expire(_epoch_key(key), EPOCH_TTL)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning("Cache invalidation for %s failed: %s", ", ".join(keys), e)
+
+async def invalidate_prefix(prefix: str):
+    """Drop every cached key starting with prefix and bump their epochs"""
+    if redis is None:
+        return
+
+    try:
+        keys = [k.decode() async for k in redis.scan_iter(match=f"{prefix}*")]
+    except RedisError as e:
+        logger.warning("Cache scan for %s* failed: %s", prefix, e)
+        return
+    # Epoch keys map back to their cache key, so in-flight writes for keys not cached yet are also fenced off
+    keys = sorted({k[:-len(":epoch")] if k.endswith(":epoch") else k for k in keys})
+    if keys:
+        await invalidate(*keys)
@@ -5,11 +5,12 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -22,11 +23,19 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # One client per worker process; size the pool so workers x maxPoolSize stays within the server's limits
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+        minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", 5)),
+        compressors="zstd",
+        retryWrites=True,
+        serverSelectionTimeoutMS=2000,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,16 +49,43 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def upsert_documents(collection_name: str, docs: List[Union[BaseModel, dict]], key: str):
+    """Insert documents missing by `key` in one unordered bulk write; existing ones are left untouched"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    ops = []
+    for data in docs:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = datetime.now(timezone.utc)
+        data_dict['updated_at'] = datetime.now(timezone.utc)
+        ops.append(UpdateOne({key: data_dict[key]}, {"$setOnInsert": data_dict}, upsert=True))
+
+    result = await db[collection_name].bulk_write(ops, ordered=False)
+    return result.upserted_count
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection, optionally restricted to the fields in `projection`"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit)
+
+def iter_documents(collection_name: str, projection: dict = None):
+    """Async cursor over all documents with `_id` rewritten server-side to a string `id`"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    if projection:
+        pipeline = [{"$project": {**projection, "_id": 0, "id": {"$toString": "$_id"}}}]
+    else:
+        pipeline = [{"$addFields": {"id": {"$toString": "$_id"}}}, {"$project": {"_id": 0}}]
+
+    return db[collection_name].aggregate(pipeline)
@@ -1,14 +1,105 @@
 import os
-from typing import List, Optional
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from bson import ObjectId
+import orjson
+from pymongo import IndexModel
+from pymongo.errors import PyMongoError
 
-from database import db, create_document, get_documents
-from schemas import Child, Progress, Lesson, Game, Mission, Achievement, Recommendation
+from database import db, create_document, iter_documents, upsert_documents
+from cache import get_cached, get_epoch, set_cached, invalidate, invalidate_prefix
+from schemas import ChildBase, Child, Progress, Lesson, Game, Mission, Achievement, Recommendation
 
-app = FastAPI(title="Gamified Digital Literacy API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Gamified Digital Literacy API", version="1.0.0", default_response_class=ORJSONResponse)
+
+# Projections: fetch only the fields an endpoint actually returns
+TITLE_ONLY = {"title": 1}
+LESSON_FIELDS = {f: 1 for f in Lesson.model_fields}
+GAME_FIELDS = {f: 1 for f in Game.model_fields}
+MISSION_FIELDS = {f: 1 for f in Mission.model_fields}
+
+# Cache TTLs in seconds: seed content is near-static, recommendations only absorb retry bursts
+CONTENT_TTL = 300
+RECOMMENDATION_TTL = 30
+
+@app.on_event("startup")
+async def create_indexes():
+    if db is None:
+        return
+    # Idempotent: existing indexes with the same spec are left as-is.
+    # A down database must not stop the app from starting; /test reports the error instead.
+    try:
+        await asyncio.gather(
+            db["lesson"].create_indexes([IndexModel("title", unique=True), IndexModel([("level", 1), ("topic", 1)])]),
+            db["game"].create_index("key", unique=True),
+            db["mission"].create_index("title", unique=True),
+            db["progress"].create_index([("child_id", 1), ("completed_at", -1)]),
+            db["child"].create_index("name"),
+        )
+    except PyMongoError as e:
+        logger.warning("Index creation skipped: %s", e)
+
+# Recommendation candidates, held in-process: rebuilt at startup, after /seed and on /admin/reload,
+# and lazily once older than CONTENT_SNAPSHOT_TTL seconds so every worker catches up
+CONTENT_SNAPSHOT_TTL = 60
+LESSONS_BY_LT: Dict[Tuple[str, str], List[dict]] = {}
+GAMES: List[dict] = []
+MISSIONS: List[dict] = []
+_content_lock = asyncio.Lock()
+_content_expires_at = 0.0
+
+async def load_content():
+    global _content_expires_at
+    lessons, games, missions = await asyncio.gather(
+        iter_documents("lesson", projection={"title": 1, "level": 1, "topic": 1}).to_list(None),
+        iter_documents("game", projection=TITLE_ONLY).to_list(None),
+        iter_documents("mission", projection=TITLE_ONLY).to_list(None),
+    )
+    by_lt = defaultdict(list)
+    for d in lessons:
+        by_lt[(d.get("level"), d.get("topic"))].append(d)
+    # Swap in without awaiting so requests never see a half-built cache
+    LESSONS_BY_LT.clear()
+    LESSONS_BY_LT.update(by_lt)
+    GAMES[:] = games
+    MISSIONS[:] = missions
+    _content_expires_at = time.monotonic() + CONTENT_SNAPSHOT_TTL
+
+async def _ensure_content():
+    if time.monotonic() < _content_expires_at:
+        return
+    loaded = _content_expires_at > 0
+    if loaded and _content_lock.locked():
+        # Another request is already refreshing; keep serving the current snapshot
+        return
+    async with _content_lock:
+        if time.monotonic() < _content_expires_at:
+            return
+        try:
+            await load_content()
+        except PyMongoError as e:
+            if not loaded:
+                raise
+            logger.warning("Content refresh failed, serving previous snapshot: %s", e)
+
+@app.on_event("startup")
+async def warm_content():
+    if db is None:
+        return
+    # Best effort: requests reload the snapshot lazily if the database is not reachable yet
+    try:
+        await load_content()
+    except PyMongoError as e:
+        logger.warning("Content preload skipped: %s", e)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,8 +113,22 @@ app.add_middleware(
 def read_root():
     return {"message": "Digital Literacy Backend Running"}
 
+# /test is polled by health probes; list collections at most once per COLLECTIONS_TTL seconds
+COLLECTIONS_TTL = 30
+_collections_lock = asyncio.Lock()
+_collections_snapshot = (0.0, [])
+
+async def _cached_collection_names():
+    global _collections_snapshot
+    async with _collections_lock:
+        expires_at, names = _collections_snapshot
+        if time.monotonic() >= expires_at:
+            names = await db.list_collection_names()
+            _collections_snapshot = (time.monotonic() + COLLECTIONS_TTL, names)
+        return names
+
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -36,11 +141,9 @@ def test_database():
     try:
         if db is not None:
             response["database"] = "✅ Available"
-            response["database_url"] = "✅ Configured"
-            response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await _cached_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -55,134 +158,216 @@ def test_database():
 
     return response
 
-# Seed minimal content if empty
+@app.post("/admin/reload")
+async def reload_content():
+    if db is None:
+        raise HTTPException(500, "Database not configured")
+    await load_content()
+    return {"lessons": sum(len(docs) for docs in LESSONS_BY_LT.values()), "games": len(GAMES), "missions": len(MISSIONS)}
+
+# Seed minimal content; documents that already exist are left untouched
 @app.post("/seed")
-def seed_content():
+async def seed_content():
     if db is None:
         raise HTTPException(500, "Database not configured")
 
-    def ensure(coll, doc):
-        if db[coll].count_documents({}) == 0:
-            create_document(coll, doc)
+    # One bulk upsert per collection; unique keys make re-seeding a no-op
+    await asyncio.gather(
+        upsert_documents("lesson", [
+            Lesson(title="Understanding Devices", topic="devices", level="easy", description="Identify phone, tablet, computer"),
+            Lesson(title="Safe vs Unsafe", topic="safety", level="easy", description="Spot safe online choices"),
+        ], key="title"),
+        upsert_documents("game", [
+            Game(title="Spot the Safe Choice", key="safe-choice", description="Tap the safe option"),
+        ], key="key"),
+        upsert_documents("mission", [
+            Mission(title="Warm-up Day", description="Finish 2 lessons today", target_type="lessons", target_count=2, reward="stars", reward_value=5),
+        ], key="title"),
+    )
 
-    ensure("lesson", Lesson(title="Understanding Devices", topic="devices", level="easy", description="Identify phone, tablet, computer").model_dump())
-    ensure("lesson", Lesson(title="Safe vs Unsafe", topic="safety", level="easy", description="Spot safe online choices").model_dump())
+    await asyncio.gather(invalidate("lessons", "games", "missions"), invalidate_prefix("recommendation:"), load_content())
 
-    ensure("game", Game(title="Spot the Safe Choice", key="safe-choice", description="Tap the safe option").model_dump())
+    return {"status": "ok"}
 
-    ensure("mission", Mission(title="Warm-up Day", description="Finish 2 lessons today", target_type="lessons", target_count=2, reward="stars", reward_value=5).model_dump())
+async def _stream_documents(cursor, cache_key: Optional[str] = None, ttl: int = 0) -> StreamingResponse:
+    """Stream a cursor of JSON-ready documents as a JSON array, caching the full list once sent if cache_key is given"""
+    # Run the query and pull the first batch before any bytes are sent, so a failing query is still a clean 500
+    epoch = await get_epoch(cache_key) if cache_key else None
+    try:
+        first = await cursor.next()
+    except StopAsyncIteration:
+        first = None
 
-    return {"status": "ok"}
+    async def gen():
+        # Only collect documents when they can be cached
+        docs = [] if epoch is not None else None
+        yield b"["
+        if first is not None:
+            yield orjson.dumps(first)
+            if docs is not None:
+                docs.append(first)
+            async for d in cursor:
+                yield b"," + orjson.dumps(d)
+                if docs is not None:
+                    docs.append(d)
+        yield b"]"
+        if docs is not None:
+            # Epoch check: skipped if /seed invalidated the key while this response was streaming
+            await set_cached(cache_key, docs, ttl, epoch=epoch)
+    return StreamingResponse(gen(), media_type="application/json")
 
 # Auth-lite child creation (no real auth for demo)
-class ChildCreate(BaseModel):
-    name: str
-    age: int
-    avatar: Optional[str] = None
-    mode: Optional[str] = "child"
-
-@app.post("/children")
-def create_child(payload: ChildCreate):
-    child = Child(**payload.model_dump())
-    child_id = create_document("child", child)
-    return {"id": child_id, "child": child}
+class ChildCreate(ChildBase):
+    pass
+
+class ChildCreated(BaseModel):
+    id: str
+    child: Child
+
+# Default-valued fields (points=0, level=1, badges=[], ...) are left out of the response
+@app.post("/children", response_model=ChildCreated, response_model_exclude_defaults=True)
+async def create_child(payload: ChildCreate):
+    # payload is already validated against the shared ChildBase fields; only defaults remain to fill
+    child = Child.model_construct(**dict(payload))
+    child_id = await create_document("child", child)
+    return ChildCreated(id=child_id, child=child)
 
 @app.get("/children")
-def list_children():
-    docs = get_documents("child")
-    for d in docs:
-        d["id"] = str(d.pop("_id"))
-    return docs
+async def list_children():
+    return await _stream_documents(iter_documents("child"))
 
 # Progress tracking
 class ProgressCreate(BaseModel):
     child_id: str
     item_type: str
     item_id: str
-    score: int
+    score: int = Field(..., ge=0, le=100)
 
 @app.post("/progress")
-def add_progress(payload: ProgressCreate):
+async def add_progress(payload: ProgressCreate):
+    if not ObjectId.is_valid(payload.child_id):
+        raise HTTPException(400, "Invalid child id")
+    cid = ObjectId(payload.child_id)
+
     prog = Progress(child_id=payload.child_id, item_type=payload.item_type, item_id=payload.item_id, score=payload.score,
-                    stars_earned=min(3, max(0, payload.score // 34)), points_earned=max(0, payload.score))
-    prog_id = create_document("progress", prog)
-    # Update child points/level basic
-    try:
-        cid = ObjectId(payload.child_id)
-        child = db["child"].find_one({"_id": cid})
-        if child:
-            new_points = (child.get("points", 0) + prog.points_earned)
-            new_level = 1 + new_points // 200
-            db["child"].update_one({"_id": cid}, {"$set": {"points": new_points, "level": new_level}})
-    except Exception:
-        pass
+                    stars_earned=payload.score // 34, points_earned=payload.score)
+    prog_id = await create_document("progress", prog)
+    # Single pipeline update: points, level and the recent-score window are derived server-side,
+    # no read-modify-write race
+    window = {"$slice": [{"$concatArrays": ["$recent_scores", [prog.score]]}, -3]}
+    result = await db["child"].update_one({"_id": cid, "recent_scores": {"$exists": True}},
+                                          _child_progress_update(prog.points_earned, window))
+    if result.matched_count == 0:
+        # Child predates recent_scores: seed the window from its progress history, which already holds this entry
+        scores = await _recent_scores_from_progress(payload.child_id)
+        await db["child"].update_one({"_id": cid}, _child_progress_update(prog.points_earned, {"$literal": scores}))
+    await invalidate(f"recommendation:{payload.child_id}")
     return {"id": prog_id}
 
+def _child_progress_update(points_earned: int, window: dict) -> list:
+    """Update pipeline adding points_earned, setting the recent-score window and deriving level/average"""
+    return [
+        {"$set": {
+            "points": {"$add": [{"$ifNull": ["$points", 0]}, points_earned]},
+            "recent_scores": window,
+        }},
+        {"$set": {
+            "level": {"$toInt": {"$add": [1, {"$floor": {"$divide": ["$points", 200]}}]}},
+            "avg_recent_score": {"$ifNull": [{"$avg": "$recent_scores"}, 0]},
+        }},
+    ]
+
+async def _recent_scores_from_progress(child_id: str) -> List[int]:
+    """Last 3 progress scores for a child, oldest first"""
+    last = await db["progress"].find({"child_id": child_id}, {"score": 1, "_id": 0}).sort("completed_at", -1).limit(3).to_list(3)
+    return [p.get("score", 0) for p in reversed(last)]
+
 # Simple Decision Tree-like recommendation
 @app.get("/recommendations/{child_id}")
-def get_recommendation(child_id: str):
+async def get_recommendation(child_id: str):
     if db is None:
         raise HTTPException(500, "Database not configured")
 
-    # Fetch child and last progress
-    try:
-        cid = ObjectId(child_id)
-    except Exception:
+    if not ObjectId.is_valid(child_id):
         raise HTTPException(400, "Invalid child id")
+    cid = ObjectId(child_id)
 
-    child = db["child"].find_one({"_id": cid})
-    if not child:
+    cached = await get_cached(f"recommendation:{child_id}")
+    if cached is not None:
+        return cached
+    # Read before the child so a result computed before a concurrent add_progress isn't cached after it
+    epoch = await get_epoch(f"recommendation:{child_id}")
+
+    # Candidates come from the in-process content cache; only the child's running average is read
+    child = await db["child"].find_one({"_id": cid}, {"_id": 0, "recent_scores": 1, "avg_recent_score": 1})
+    if child is None:
         raise HTTPException(404, "Child not found")
 
-    last = db["progress"].find({"child_id": child_id}).sort("completed_at", -1).limit(3)
-    scores = [p.get("score", 0) for p in last]
-    avg = sum(scores) / len(scores) if scores else 0
+    if "recent_scores" in child:
+        avg = child.get("avg_recent_score", 0)
+    else:
+        # Child predates recent_scores: compute from progress without saving; add_progress is the
+        # only writer of the window, so a concurrent progress entry can't be counted twice
+        scores = await _recent_scores_from_progress(child_id)
+        avg = sum(scores) / len(scores) if scores else 0
+
+    await _ensure_content()
+    rec = _pick_recommendation(child_id, avg)
+    await set_cached(f"recommendation:{child_id}", rec, RECOMMENDATION_TTL, epoch=epoch)
+    return rec
+
+def _first_lesson(level: str, topic: Optional[str] = None) -> Optional[dict]:
+    if topic is not None:
+        docs = LESSONS_BY_LT.get((level, topic))
+        return docs[0] if docs else None
+    return next((docs[0] for (lvl, _), docs in LESSONS_BY_LT.items() if lvl == level), None)
 
+def _pick_recommendation(child_id: str, avg: float) -> dict:
     # Decision Tree (hand-crafted rules for demo):
     # If average < 50 -> recommend easy safety lesson
     # If 50-80 -> medium etiquette or devices
     # If >80 -> advanced cybersecurity or a game
     if avg < 50:
-        doc = db["lesson"].find_one({"level": "easy", "topic": "safety"}) or db["lesson"].find_one({"level": "easy"})
+        doc = _first_lesson("easy", "safety") or _first_lesson("easy")
         if doc:
-            return Recommendation(child_id=child_id, recommended_type="lesson", ref_id=str(doc["_id"]), title=doc.get("title"), reason="Average score low; reinforce safety basics").model_dump()
+            return Recommendation(child_id=child_id, recommended_type="lesson", ref_id=doc["id"], title=doc.get("title"), reason="Average score low; reinforce safety basics").model_dump()
     elif avg <= 80:
-        doc = db["lesson"].find_one({"level": "medium"}) or db["lesson"].find_one({"level": "easy"})
+        doc = _first_lesson("medium") or _first_lesson("easy")
         if doc:
-            return Recommendation(child_id=child_id, recommended_type="lesson", ref_id=str(doc["_id"]), title=doc.get("title"), reason="Doing well; try a medium challenge").model_dump()
+            return Recommendation(child_id=child_id, recommended_type="lesson", ref_id=doc["id"], title=doc.get("title"), reason="Doing well; try a medium challenge").model_dump()
     else:
-        doc = db["game"].find_one({})
+        doc = GAMES[0] if GAMES else None
         if doc:
-            return Recommendation(child_id=child_id, recommended_type="game", ref_id=str(doc["_id"]), title=doc.get("title"), reason="Great scores; keep it fun with a game").model_dump()
+            return Recommendation(child_id=child_id, recommended_type="game", ref_id=doc["id"], title=doc.get("title"), reason="Great scores; keep it fun with a game").model_dump()
 
     # Fallback to a mission
-    doc = db["mission"].find_one({})
+    doc = MISSIONS[0] if MISSIONS else None
     if doc:
-        return Recommendation(child_id=child_id, recommended_type="mission", ref_id=str(doc["_id"]), title=doc.get("title"), reason="General growth mission").model_dump()
+        return Recommendation(child_id=child_id, recommended_type="mission", ref_id=doc["id"], title=doc.get("title"), reason="General growth mission").model_dump()
 
     return {"message": "No recommendation available yet"}
 
 # Public content endpoints
 @app.get("/lessons")
-def list_lessons():
-    docs = get_documents("lesson")
-    for d in docs:
-        d["id"] = str(d.pop("_id"))
-    return docs
+async def list_lessons():
+    cached = await get_cached("lessons")
+    if cached is not None:
+        return ORJSONResponse(cached)
+    return await _stream_documents(iter_documents("lesson", projection=LESSON_FIELDS), "lessons", CONTENT_TTL)
 
 @app.get("/games")
-def list_games():
-    docs = get_documents("game")
-    for d in docs:
-        d["id"] = str(d.pop("_id"))
-    return docs
+async def list_games():
+    cached = await get_cached("games")
+    if cached is not None:
+        return ORJSONResponse(cached)
+    return await _stream_documents(iter_documents("game", projection=GAME_FIELDS), "games", CONTENT_TTL)
 
 @app.get("/missions")
-def list_missions():
-    docs = get_documents("mission")
-    for d in docs:
-        d["id"] = str(d.pop("_id"))
-    return docs
+async def list_missions():
+    cached = await get_cached("missions")
+    if cached is not None:
+        return ORJSONResponse(cached)
+    return await _stream_documents(iter_documents("mission", projection=MISSION_FIELDS), "missions", CONTENT_TTL)
 
 if __name__ == "__main__":
     import uvicorn
@@ -9,15 +9,19 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 
 # Core profiles
-class Child(BaseModel):
+class ChildBase(BaseModel):
     name: str = Field(..., description="Child's display name")
     age: int = Field(..., ge=3, le=10, description="Age in years")
     avatar: Optional[str] = Field(None, description="Avatar image URL or key")
     mode: Literal["child", "guest"] = Field("child", description="Access mode")
+
+class Child(ChildBase):
     points: int = Field(0, ge=0)
     level: int = Field(1, ge=1)
     stars: int = Field(0, ge=0)
     badges: List[str] = Field(default_factory=list)
+    recent_scores: List[int] = Field(default_factory=list, max_length=3, description="Last 3 progress scores, oldest first")
+    avg_recent_score: float = Field(0, ge=0, le=100, description="Mean of recent_scores")
 
 class Parent(BaseModel):
     name: str